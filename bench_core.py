@@ -0,0 +1,504 @@
+"""
+Shared core for the benchmark runners.
+
+Both ci_benchmark.py (CI matrix runner) and run_benchmark.py (local /
+Excel-driven runner) spawn the same server+client JVM pipeline and parse
+the same log format, so the level discovery, compilation, process
+handling and output parsing live here once.
+"""
+
+import contextlib
+from dataclasses import asdict, dataclass
+import glob
+import os
+import re
+import select
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    from tqdm import tqdm as _tqdm
+    HAS_TQDM = True
+except ImportError:
+    HAS_TQDM = False
+
+
+# ── Configuration ────────────────────────────────────────────────────────────
+LEVEL_DIR = "levels"
+SERVER_JAR = "server.jar"
+DEFAULT_TIMEOUT = 180          # seconds per level
+JAVA_XMX = "4g"
+VALID_STRATEGIES = ["bfs", "dfs", "astar", "wastar", "greedy"]
+CDS_ARCHIVE = "sc.jsa"
+
+# The server JVM shuttles protocol lines and renders; it never gets hot
+# enough to need C2, so skip it and map the default CDS archive to cut
+# its startup. The client keeps full tiered compilation — its search
+# loop is compute-bound and C1-only code would cost far more than the
+# startup it saves on the long levels.
+SERVER_JVM_FLAGS = ["-XX:TieredStopAtLevel=1", "-Xshare:auto"]
+
+# Extra client JVM flags; prepare_cds() fills this in when an AppCDS
+# archive is available so every run_level invocation picks it up.
+_client_jvm_flags = []
+
+# Progress lines from parallel workers must not interleave mid-line.
+_print_lock = threading.Lock()
+
+
+def progress(iterable, total):
+    """Wrap a completion iterator in a tqdm bar when tqdm is installed.
+
+    One repainting bar replaces a flushed print per finished level, so
+    parallel workers stop contending on stdout's lock; callers pass
+    verbose=not HAS_TQDM to run_level so the per-level lines come back
+    when there is no bar.
+    """
+    if not HAS_TQDM:
+        return iterable
+    return _tqdm(iterable, total=total, unit="level")
+
+# Compiled once, as bytes patterns: the child's output is consumed raw off
+# the pipe and only the captured groups are ever decoded, so multi-MB logs
+# never pay for a full bytes→str conversion. Numbers may contain commas
+# (e.g. 4,230,326). The search status line always carries all four fields
+# in this order, so one search replaces four separate passes over the line.
+_METRICS_RE = re.compile(
+    rb"#Expanded:\s*(?P<exp>[\d,]+).*?"
+    rb"#Frontier:\s*(?P<frt>[\d,]+).*?"
+    rb"#Generated:\s*(?P<gen>[\d,]+).*?"
+    rb"Time:\s*(?P<t>[\d.]+)\s*s"
+)
+
+_LEN_RE = re.compile(rb"Found solution of length\s+([\d,]+)")
+_MEM_RE = re.compile(rb"Memory used:\s*(\S.*?)\s*$")
+
+
+
+def default_jobs():
+    """Default worker count: one JVM heap (JAVA_XMX) per worker must fit in RAM."""
+    cpus = os.cpu_count() or 1
+    try:
+        total_ram_gb = (os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")) // (1 << 30)
+    except (ValueError, OSError, AttributeError):
+        return cpus
+    return min(cpus, max(1, total_ram_gb // int(JAVA_XMX[:-1])))
+
+
+def discover_levels(filter_prefix=None):
+    """Return sorted (path, stem) tuples for levels/*.lvl matching the prefix.
+
+    One scandir pass instead of glob (which stats every entry); the level
+    stem is computed once here so callers never touch os.path again.
+    """
+    prefix = filter_prefix or ""
+    try:
+        levels = [
+            (entry.path, entry.name[:-4])
+            for entry in os.scandir(LEVEL_DIR)
+            if entry.name.endswith(".lvl") and entry.name.startswith(prefix)
+        ]
+    except FileNotFoundError:
+        levels = []
+    levels.sort()
+    return levels
+
+
+def _up_to_date(src: str):
+    """True if src's .class file exists and is no older than the source."""
+    cls = src[:-5] + ".class"
+    try:
+        return os.path.getmtime(cls) >= os.path.getmtime(src)
+    except OSError:
+        return False
+
+
+def compile_client():
+    """Compile the search client with javac (only sources newer than their .class)."""
+    # Expand the glob in Python and exec javac directly: no /bin/sh fork, and
+    # shell=False lets CPython spawn via posix_spawn() instead of fork+exec.
+    java_files = sorted(glob.glob("searchclient/*.java"))
+    if not java_files:
+        print("ERROR: No .java files found in searchclient/")
+        sys.exit(1)
+    # javac pulls in stale dependencies of the listed files on its own, so
+    # an mtime check per source is enough to make --compile cheap when
+    # nothing changed. -proc:none skips the annotation-processor scan.
+    stale = [src for src in java_files if not _up_to_date(src)]
+    if not stale:
+        print("searchclient/ classes up to date, skipping compilation.\n")
+        return
+    print(f"Compiling {len(stale)} of {len(java_files)} searchclient/*.java ...")
+    result = subprocess.run(
+        ["javac", "-proc:none", *stale],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        print("ERROR: Compilation failed!")
+        print(result.stderr)
+        sys.exit(1)
+    print("Compilation successful.\n")
+
+
+def prepare_cds():
+    """Dump an AppCDS archive of the client's classes to cut JVM startup.
+
+    Runs the client once with -XX:ArchiveClassesAtExit (it exits almost
+    immediately on EOF from stdin — that is enough to record the loaded
+    classes). Every subsequent run_level then maps the archive with
+    -Xshare:auto, saving a few hundred ms of class loading per level.
+    Failure is non-fatal: older JVMs simply run without the archive.
+    """
+    global _client_jvm_flags, _CLIENT_CMD_TPL
+    try:
+        subprocess.run(
+            ["java", f"-Xmx{JAVA_XMX}", f"-XX:ArchiveClassesAtExit={CDS_ARCHIVE}",
+             "searchclient.SearchClient", "-bfs"],
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            timeout=60,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        pass
+    if os.path.exists(CDS_ARCHIVE):
+        _client_jvm_flags = [f"-XX:SharedArchiveFile={CDS_ARCHIVE}", "-Xshare:auto"]
+        _CLIENT_CMD_TPL = None   # force the cached command template to pick these up
+        print(f"CDS archive ready: {CDS_ARCHIVE}\n")
+        return True
+    print("CDS archive dump failed; running without it.\n")
+    return False
+
+
+# ── Output parsing ───────────────────────────────────────────────────────────
+
+# What run_level hands back. A slotted dataclass rather than a dict: the
+# report writers do six lookups per row, attribute access on a fixed
+# layout is cheaper than hashed dict lookups, instances carry no
+# __dict__, and typos fail loudly. Numeric fields hold real numbers
+# (None when never seen); str is allowed only for sentinel displays
+# like ">180" on timeout. fmt() renders either for reports.
+@dataclass(slots=True)
+class Metrics:
+    status: str = "-"
+    solved: bool = False
+    solution_length: int | None = None
+    time: float | str | None = None
+    wall_time: float | str | None = None
+    memory: str | None = None
+    expanded: int | None = None
+    frontier_size: int | None = None
+    generated: int | None = None
+
+    def to_dict(self):
+        """Dict view for serialization (the JSONL worker protocol)."""
+        return asdict(self)
+
+
+def fmt(val):
+    """Render a metric for display: thousands separators for ints, a
+    dash for absent values, pass-through for strings like '>180'."""
+    if val is None:
+        return "-"
+    if isinstance(val, int):
+        return f"{val:,}"
+    return str(val)
+
+
+def _finish(parsed: dict, status: str, wall_time):
+    """Freeze the mutable parse-state dict into a Metrics result."""
+    return Metrics(status=status, wall_time=wall_time, **parsed)
+
+
+def _new_metrics():
+    """Fresh metrics dict with every field at its 'not seen' default."""
+    return {
+        "solved": False,
+        "solution_length": None,
+        "time": None,
+        "memory": None,
+        "expanded": None,
+        "frontier_size": None,
+        "generated": None,
+    }
+
+
+def _on_solution(metrics: dict, line: bytes):
+    metrics["solved"] = True
+    m = _LEN_RE.search(line)
+    if m:
+        metrics["solution_length"] = int(m.group(1).replace(b",", b""))
+
+
+def _on_status(metrics: dict, line: bytes):
+    m = _METRICS_RE.search(line)
+    if m:
+        # int() straight off the comma-stripped bytes: no str round-trip,
+        # and downstream consumers never re-coerce.
+        metrics["expanded"] = int(m["exp"].replace(b",", b""))
+        metrics["frontier_size"] = int(m["frt"].replace(b",", b""))
+        metrics["generated"] = int(m["gen"].replace(b",", b""))
+        metrics["time"] = float(m["t"])
+
+
+def _on_memory(metrics: dict, line: bytes):
+    m = _MEM_RE.search(line)
+    if m:
+        metrics["memory"] = m.group(1).decode("utf-8", "replace")
+
+
+def _on_unsolvable(metrics: dict, line: bytes):
+    metrics["solved"] = False
+    return True      # the client gives up right after this line
+
+
+_HANDLERS = {
+    b"Found solution of length": _on_solution,
+    b"#Expanded:": _on_status,
+    b"Memory used:": _on_memory,
+    b"Unable to solve level": _on_unsolvable,
+}
+
+
+def _summary_complete(metrics: dict):
+    """True once the solution line and the trailing summary have been seen.
+
+    The memory line is printed by the server after the plan has executed,
+    so a solved level with memory and expansion counts recorded has
+    nothing left to report.
+    """
+    return (metrics["solved"]
+            and metrics["memory"] is not None
+            and metrics["expanded"] is not None)
+
+
+def _make_parser(needles):
+    """Build a line parser specialized to the given needles.
+
+    The returned callable has the same contract as a per-line update:
+    update(metrics, line) -> True once the result is final. A single
+    alternation scan over only the needles that strategy emits rejects
+    the vast majority of lines; only hits pay for a handler and its
+    detailed regex. When multiple progress lines exist, the last one
+    wins.
+    """
+    any_re = re.compile(b"(" + b"|".join(re.escape(n) for n in needles) + b")")
+    handlers = {n: _HANDLERS[n] for n in needles}
+
+    def update(metrics: dict, line: bytes):
+        hit = any_re.search(line)
+        if hit is not None:
+            return handlers[hit.group(1)](metrics, line) or _summary_complete(metrics)
+        return False
+
+    # Exposed so whole-buffer consumers (parse_output) can drive the same
+    # alternation with finditer instead of splitting lines first.
+    update.any_re = any_re
+    update.handlers = handlers
+    return update
+
+
+# All strategies currently share GraphSearch's status format, so they map
+# to one parser; the table gives each its own slot so a strategy that
+# stops emitting, say, frontier counts can get a slimmer parser without
+# touching run_level.
+_update_metrics = _make_parser(tuple(_HANDLERS))
+PARSERS = {strategy: _update_metrics for strategy in VALID_STRATEGIES}
+
+
+def get_parser(strategy: str):
+    """Per-strategy line parser; unknown strategies get the full parser."""
+    return PARSERS.get(strategy, _update_metrics)
+
+
+def parse_output(output):
+    """Parse a complete server/client log for key metrics (see _update_metrics).
+
+    Accepts bytes (preferred — the parser is bytes-native) or str.
+    """
+    if isinstance(output, str):
+        output = output.encode("utf-8", "replace")
+    metrics = _new_metrics()
+    # One alternation pass over the whole buffer instead of splitting it
+    # into lines first: only hits ever materialize their surrounding line.
+    for m in _update_metrics.any_re.finditer(output):
+        start = output.rfind(b"\n", 0, m.start()) + 1
+        end = output.find(b"\n", m.end())
+        line = output[start:] if end == -1 else output[start:end]
+        if _update_metrics.handlers[m.group(1)](metrics, line) or _summary_complete(metrics):
+            break
+    return metrics
+
+
+# ── Running a level ──────────────────────────────────────────────────────────
+
+def _java_bin():
+    """Absolute path of the java launcher (posix_spawn does not search PATH)."""
+    global _JAVA_BIN
+    if _JAVA_BIN is None:
+        _JAVA_BIN = shutil.which("java") or "java"
+    return _JAVA_BIN
+
+
+_JAVA_BIN = None
+
+
+def _server_cmd_prefix():
+    """Immutable head of the server argv — identical for every level, so
+    it is assembled once and splatted into each run's command."""
+    global _SERVER_CMD_PREFIX
+    if _SERVER_CMD_PREFIX is None:
+        _SERVER_CMD_PREFIX = (_java_bin(), *SERVER_JVM_FLAGS, "-jar", SERVER_JAR)
+    return _SERVER_CMD_PREFIX
+
+
+_SERVER_CMD_PREFIX = None
+
+
+def _client_cmd_template():
+    """Client command with a '{}' slot for the strategy; rebuilt only when
+    prepare_cds() changes the client JVM flags."""
+    global _CLIENT_CMD_TPL
+    if _CLIENT_CMD_TPL is None:
+        _CLIENT_CMD_TPL = " ".join(
+            ["java", f"-Xmx{JAVA_XMX}", *_client_jvm_flags,
+             "searchclient.SearchClient", "-{}"]
+        )
+    return _CLIENT_CMD_TPL
+
+
+_CLIENT_CMD_TPL = None
+
+
+def _fast_spawn(argv, quiet=False):
+    """Spawn argv via os.posix_spawn with stdout+stderr merged onto one pipe.
+
+    Skips subprocess.Popen's setup glue entirely — on hot loops spawning
+    many short-lived JVMs the per-call overhead adds up. With quiet=True
+    the child's stdout goes to /dev/null and only stderr (where the
+    client prints its metrics) is piped, cutting IPC bandwidth for
+    chatty servers. Returns (pid, read_fd); the caller owns both.
+    """
+    r, w = os.pipe()
+    if quiet:
+        stdout_action = (os.POSIX_SPAWN_OPEN, 1, os.devnull, os.O_WRONLY, 0o644)
+    else:
+        stdout_action = (os.POSIX_SPAWN_DUP2, w, 1)
+    try:
+        pid = os.posix_spawn(
+            argv[0], argv, os.environ,
+            file_actions=[
+                stdout_action,
+                (os.POSIX_SPAWN_DUP2, w, 2),
+                (os.POSIX_SPAWN_CLOSE, r),
+                (os.POSIX_SPAWN_CLOSE, w),
+            ],
+        )
+    except Exception:
+        os.close(r)
+        os.close(w)
+        raise
+    os.close(w)
+    return pid, r
+
+
+def run_level(level_path: str, strategy: str, timeout: int, quiet: bool = False,
+              verbose: bool = True):
+    """Run a single level through the server and return parsed metrics.
+
+    With quiet=True the server's stdout is dropped at the kernel instead
+    of being piped and scanned; only the client's stderr is parsed.
+    verbose=False suppresses the per-level progress line (used when the
+    caller drives a progress bar instead).
+    """
+    cmd = [
+        *_server_cmd_prefix(),
+        "-l", level_path,
+        "-c", _client_cmd_template().format(strategy),
+        "-t", str(timeout),
+    ]
+
+    level_name = os.path.basename(level_path)
+
+    wall_start = time.time()
+    try:
+        # Stream the combined stdout+stderr instead of buffering the whole
+        # log (BFS progress spew can be huge); completed lines feed the
+        # incremental parser and are then dropped. The select loop doubles
+        # as the timeout guard, so a wedged server cannot block us.
+        pid, rfd = _fast_spawn(cmd, quiet=quiet)
+        update = get_parser(strategy)
+        metrics = _new_metrics()
+        stopped_early = False
+        deadline = time.monotonic() + timeout + 10
+        pending = b""
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    with contextlib.suppress(ProcessLookupError):
+                        os.kill(pid, signal.SIGKILL)
+                    os.waitpid(pid, 0)
+                    raise subprocess.TimeoutExpired(cmd, timeout)
+                ready, _, _ = select.select([rfd], [], [], remaining)
+                if not ready:
+                    continue
+                chunk = os.read(rfd, 1 << 16)
+                if not chunk:
+                    break
+                pending += chunk
+                *lines, pending = pending.split(b"\n")
+                for raw in lines:
+                    if update(metrics, raw):
+                        # Result is final; don't sit through trailing
+                        # diagnostics (or a doomed search) to the timeout.
+                        stopped_early = True
+                        with contextlib.suppress(ProcessLookupError):
+                            os.kill(pid, signal.SIGTERM)
+                        break
+                if stopped_early:
+                    break
+            if pending and not stopped_early:
+                update(metrics, pending)
+        finally:
+            os.close(rfd)
+        _, status = os.waitpid(pid, 0)
+        # An exit status caused by our own terminate is not an error.
+        returncode = 0 if stopped_early else os.waitstatus_to_exitcode(status)
+        wall_time = time.time() - wall_start
+
+        if returncode != 0 and not metrics["solved"]:
+            status = "❌ Error"
+            outcome = f"Error (exit {returncode})"
+        elif metrics["solved"]:
+            status = "✅ Solved"
+            outcome = f"Solved  len={fmt(metrics['solution_length']):>6s}  t={fmt(metrics['time']):>8s}s"
+        else:
+            status = "❌ No solution"
+            outcome = f"No solution  t={fmt(metrics['time']):>8s}s"
+
+        if verbose:
+            with _print_lock:
+                print(f"  {level_name:<40s}  {outcome}", flush=True)
+
+        return _finish(metrics, status, round(wall_time, 1))
+
+    except subprocess.TimeoutExpired:
+        if verbose:
+            with _print_lock:
+                print(f"  {level_name:<40s}  ⏱️  Timeout (>{timeout}s)", flush=True)
+        result = _finish(_new_metrics(), "⏱️ Timeout", f">{timeout}")
+        result.time = f">{timeout}"
+        return result
+    except OSError as e:
+        # Spawn/pipe failures (java missing, fd exhaustion, ...). Anything
+        # else is a programming error and should propagate, not be folded
+        # into a benchmark row.
+        if verbose:
+            with _print_lock:
+                print(f"  {level_name:<40s}  Exception: {e}", flush=True)
+        return _finish(_new_metrics(), "❌ Exception", None)
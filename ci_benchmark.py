@@ -11,162 +11,28 @@ Usage:
 """
 
 import argparse
+import concurrent.futures
+import functools
 import glob
 import os
-import re
-import subprocess
 import sys
 import time
 
-
-# ── Configuration ────────────────────────────────────────────────────────────
-LEVEL_DIR = "levels"
-SERVER_JAR = "server.jar"
-DEFAULT_TIMEOUT = 180
-JAVA_XMX = "4g"
-VALID_STRATEGIES = ["bfs", "dfs", "astar", "wastar", "greedy"]
-
-
-# ── Helpers ──────────────────────────────────────────────────────────────────
-
-def compile_client():
-    """Compile the search client with javac."""
-    print("Compiling searchclient/*.java ...")
-    result = subprocess.run(
-        ["javac", "searchclient/*.java"],
-        shell=True,
-        capture_output=True,
-        text=True,
-    )
-    if result.returncode != 0:
-        print("ERROR: Compilation failed!")
-        print(result.stderr)
-        sys.exit(1)
-    print("Compilation successful.\n")
-
-
-def parse_output(output: str):
-    """
-    Parse combined stdout+stderr from the server / client for key metrics.
-
-    Handles numbers with commas (e.g. 4,230,326).
-    When multiple progress lines exist, keeps the last one.
-    """
-    solved = False
-    solution_length = "-"
-    solve_time = "-"
-    memory = "-"
-    expanded = "-"
-    frontier_size = "-"
-    generated = "-"
-
-    for line in output.splitlines():
-        if "Found solution of length" in line:
-            solved = True
-            try:
-                solution_length = line.split("length")[1].strip().strip(".,").replace(",", "")
-            except Exception:
-                pass
-
-        if "#Expanded:" in line:
-            try:
-                m_exp = re.search(r"#Expanded:\s*([\d,]+)", line)
-                m_frt = re.search(r"#Frontier:\s*([\d,]+)", line)
-                m_gen = re.search(r"#Generated:\s*([\d,]+)", line)
-                m_time = re.search(r"Time:\s*([\d.]+)\s*s", line)
-                if m_exp:
-                    expanded = m_exp.group(1).replace(",", "")
-                if m_frt:
-                    frontier_size = m_frt.group(1).replace(",", "")
-                if m_gen:
-                    generated = m_gen.group(1).replace(",", "")
-                if m_time:
-                    solve_time = m_time.group(1)
-            except Exception:
-                pass
-
-        if "Memory used:" in line:
-            try:
-                memory = line.split("Memory used:")[1].strip()
-            except Exception:
-                pass
-
-        if "Unable to solve level" in line:
-            solved = False
-
-    return {
-        "solved": solved,
-        "solution_length": solution_length,
-        "time": solve_time,
-        "memory": memory,
-        "expanded": expanded,
-        "generated": generated,
-    }
-
-
-def run_level(level_path: str, strategy: str, timeout: int):
-    """Run a single level through the server and return parsed metrics."""
-    client_cmd = f"java -Xmx{JAVA_XMX} searchclient.SearchClient -{strategy}"
-    cmd = [
-        "java", "-jar", SERVER_JAR,
-        "-l", level_path,
-        "-c", client_cmd,
-        "-t", str(timeout),
-    ]
-
-    level_name = os.path.basename(level_path)
-    print(f"  {level_name:<40s}", end="", flush=True)
-
-    wall_start = time.time()
-    try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=timeout + 10,
-        )
-        wall_time = time.time() - wall_start
-        full_output = (result.stdout or "") + "\n" + (result.stderr or "")
-
-        metrics = parse_output(full_output)
-
-        if result.returncode != 0 and not metrics["solved"]:
-            metrics["status"] = "❌ Error"
-            print(f"  Error (exit {result.returncode})")
-        elif metrics["solved"]:
-            metrics["status"] = "✅ Solved"
-            print(f"  Solved  len={metrics['solution_length']:>6s}  t={metrics['time']:>8s}s")
-        else:
-            metrics["status"] = "❌ No solution"
-            print(f"  No solution  t={metrics['time']:>8s}s")
-
-        metrics["wall_time"] = f"{wall_time:.1f}"
-        return metrics
-
-    except subprocess.TimeoutExpired:
-        print(f"  ⏱️  Timeout (>{timeout}s)")
-        return {
-            "status": "⏱️ Timeout",
-            "solved": False,
-            "solution_length": "-",
-            "time": f">{timeout}",
-            "wall_time": f">{timeout}",
-            "memory": "-",
-            "expanded": "-",
-            "generated": "-",
-        }
-    except Exception as e:
-        print(f"  Exception: {e}")
-        return {
-            "status": "❌ Exception",
-            "solved": False,
-            "solution_length": "-",
-            "time": "-",
-            "wall_time": "-",
-            "memory": "-",
-            "expanded": "-",
-            "generated": "-",
-        }
+from bench_core import (
+    DEFAULT_TIMEOUT,
+    HAS_TQDM,
+    JAVA_XMX,
+    LEVEL_DIR,
+    SERVER_JAR,
+    VALID_STRATEGIES,
+    compile_client,
+    default_jobs,
+    discover_levels,
+    fmt,
+    prepare_cds,
+    progress,
+    run_level,
+)
 
 
 # ── Main ─────────────────────────────────────────────────────────────────────
@@ -183,6 +49,16 @@ def main():
                         help="Output markdown file (default: results-{strategy}-{filter}.md)")
     parser.add_argument("--compile", action="store_true",
                         help="Compile searchclient before running")
+    parser.add_argument("-j", "--jobs", type=int, default=default_jobs(),
+                        help="Number of levels to run in parallel "
+                             f"(default: {default_jobs()}, bounded by CPUs and RAM/Xmx)")
+    parser.add_argument("--quiet", action="store_true",
+                        help="Discard server stdout at the kernel; parse only client stderr")
+    parser.add_argument("--no-cds", action="store_true",
+                        help="Skip the AppCDS class-archive warmup (for debugging)")
+    parser.add_argument("--persistent", action="store_true",
+                        help="Dispatch levels to long-lived persistent_worker processes "
+                             "over JSONL instead of spawning from this process")
     args = parser.parse_args()
 
     if args.output is None:
@@ -211,65 +87,80 @@ def main():
         print("  or run with --compile flag")
         sys.exit(1)
 
+    if not args.no_cds:
+        prepare_cds()
+
     # ── Discover levels ──────────────────────────────────────────────────
-    pattern = os.path.join(LEVEL_DIR, "*.lvl")
-    levels = sorted(glob.glob(pattern))
-    levels = [l for l in levels if os.path.basename(l).startswith(args.filter)]
+    levels = discover_levels(args.filter)
 
     if not levels:
         print(f"No levels found matching prefix '{args.filter}' in {LEVEL_DIR}/")
         sys.exit(1)
 
-    print(f"Found {len(levels)} level(s).\n")
+    print(f"Found {len(levels)} level(s), running {args.jobs} in parallel.\n")
 
     # ── Run benchmark ────────────────────────────────────────────────────
-    results = []
+    # Each level is an independent JVM process, so worker threads just block
+    # on subprocess.run; results stream in as levels finish but the report
+    # keeps the sorted level order.
     solved_count = 0
     timeout_count = 0
     error_count = 0
 
-    for lvl in levels:
-        level_name = os.path.basename(lvl).replace(".lvl", "")
-        metrics = run_level(lvl, args.strategy, args.timeout)
+    pool = None
+    if args.persistent:
+        from persistent_worker import WorkerPool
+        pool = WorkerPool(args.jobs)
+        runner = pool.run_level
+    else:
+        # With a tqdm bar the workers stay silent; without one they keep
+        # their per-level progress lines.
+        runner = functools.partial(run_level, quiet=args.quiet, verbose=not HAS_TQDM)
+
+    metrics_by_level = {}
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as ex:
+            futures = {
+                ex.submit(runner, path, args.strategy, args.timeout): stem
+                for path, stem in levels
+            }
+            for fut in progress(concurrent.futures.as_completed(futures), len(futures)):
+                metrics_by_level[futures[fut]] = fut.result()
+    finally:
+        if pool is not None:
+            pool.close()
+
+    results = []
+    for _path, level_name in levels:
+        metrics = metrics_by_level[level_name]
         results.append((level_name, metrics))
-        if metrics["solved"]:
+        if metrics.solved:
             solved_count += 1
-        elif "Timeout" in metrics["status"]:
+        elif "Timeout" in metrics.status:
             timeout_count += 1
         else:
             error_count += 1
 
     # ── Generate markdown report ─────────────────────────────────────────
-    lines = []
-    lines.append(f"## {args.filter} — {args.strategy.upper()}\n")
-    lines.append(f"**Date:** {time.strftime('%Y-%m-%d %H:%M:%S')}  ")
-    lines.append(f"**Strategy:** `{args.strategy}` | **Timeout:** {args.timeout}s | **Java Xmx:** {JAVA_XMX}  ")
-    lines.append(f"**Score:** {solved_count}/{len(levels)} solved")
-    if timeout_count:
-        lines.append(f" | {timeout_count} timeout")
-    if error_count:
-        lines.append(f" | {error_count} error/unsolved")
-    lines.append("\n")
-    lines.append("| Level | Status | Solution Length | Time (s) | Generated | Memory |")
-    lines.append("|-------|--------|-----------------|----------|-----------|--------|")
-
-    for level_name, m in results:
-        lines.append(
-            f"| `{level_name}` "
-            f"| {m['status']} "
-            f"| {m['solution_length']} "
-            f"| {m['time']} "
-            f"| {m['generated']} "
-            f"| {m['memory']} |"
-        )
-
-    lines.append("")
-
-    report = "\n".join(lines) + "\n"
-
+    # Written straight through a buffered handle: no intermediate lines
+    # list, no final join.
     try:
-        with open(args.output, "w", encoding="utf-8") as f:
-            f.write(report)
+        with open(args.output, "w", encoding="utf-8", buffering=1 << 16) as f:
+            f.write(f"## {args.filter} — {args.strategy.upper()}\n\n")
+            f.write(f"**Date:** {time.strftime('%Y-%m-%d %H:%M:%S')}  \n")
+            f.write(f"**Strategy:** `{args.strategy}` | **Timeout:** {args.timeout}s | **Java Xmx:** {JAVA_XMX}  \n")
+            f.write(f"**Score:** {solved_count}/{len(levels)} solved\n")
+            if timeout_count:
+                f.write(f" | {timeout_count} timeout\n")
+            if error_count:
+                f.write(f" | {error_count} error/unsolved\n")
+            f.write("\n\n")
+            f.write("| Level | Status | Solution Length | Time (s) | Generated | Memory |\n")
+            f.write("|-------|--------|-----------------|----------|-----------|--------|\n")
+            for level_name, m in results:
+                f.write(f"| `{level_name}` | {m.status} | {fmt(m.solution_length)} "
+                        f"| {fmt(m.time)} | {fmt(m.generated)} | {fmt(m.memory)} |\n")
+            f.write("\n")
         print(f"\n{'=' * 60}")
         print(f"  Results saved to {args.output}")
         print(f"  Score: {solved_count}/{len(levels)} solved")
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Long-lived benchmark worker speaking newline-delimited JSON.
+
+Each worker process reads one command per line on stdin:
+
+    {"lvl": "levels/MAPF00.lvl", "strategy": "bfs", "timeout": 180}
+
+runs the level through bench_core.run_level, and answers with one
+result frame per line on stdout:
+
+    {"status": "✅ Solved", "metrics": {...}}
+
+The course server.jar has no daemon mode, so every level still pays its
+own JVM startup; what this wrapper amortizes is the Python-side startup
+of the runners, and it is the single integration point to swap in a
+kept-alive JVM should a daemonized server become available.
+
+Usage: spawned by the benchmark runners via WorkerPool (--persistent);
+can also be driven manually for debugging:
+
+    echo '{"lvl": "levels/MAPF00.lvl", "strategy": "bfs"}' | python persistent_worker.py
+"""
+
+import contextlib
+import json
+import os
+import queue
+import subprocess
+import sys
+
+import bench_core
+
+
+def serve(stdin=sys.stdin, stdout=sys.stdout):
+    """Process JSONL commands until stdin closes."""
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            cmd = json.loads(line)
+            level_path = cmd["lvl"]
+            strategy = cmd["strategy"]
+            timeout = int(cmd.get("timeout", bench_core.DEFAULT_TIMEOUT))
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+            frame = {"status": "❌ Exception", "error": f"bad command: {e}"}
+        else:
+            # stdout is the result channel; run_level's progress line must
+            # go to stderr like any other diagnostic output.
+            with contextlib.redirect_stdout(sys.stderr):
+                metrics = bench_core.run_level(level_path, strategy, timeout)
+            frame = {"status": metrics.status, "metrics": metrics.to_dict()}
+        stdout.write(json.dumps(frame) + "\n")
+        stdout.flush()
+
+
+class WorkerPool:
+    """Fixed pool of persistent worker processes, one in-flight level each.
+
+    run_level is thread-safe: callers borrow a worker for the duration of
+    one level, so it drops in for bench_core.run_level under the runners'
+    thread-pool dispatch.
+    """
+
+    def __init__(self, size: int):
+        argv = [sys.executable, os.path.abspath(__file__)]
+        self._procs = []
+        self._idle = queue.Queue()
+        for _ in range(size):
+            proc = subprocess.Popen(
+                argv,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                text=True,
+                bufsize=1,
+                close_fds=True,
+            )
+            self._procs.append(proc)
+            self._idle.put(proc)
+
+    def run_level(self, level_path: str, strategy: str, timeout: int):
+        proc = self._idle.get()
+        try:
+            proc.stdin.write(json.dumps(
+                {"lvl": level_path, "strategy": strategy, "timeout": timeout}
+            ) + "\n")
+            proc.stdin.flush()
+            reply = proc.stdout.readline()
+        finally:
+            self._idle.put(proc)
+
+        if not reply:
+            return self._failure(f"worker exited (pid {proc.pid})")
+        frame = json.loads(reply)
+        if frame.get("metrics"):
+            return bench_core.Metrics(**frame["metrics"])
+        return self._failure(frame.get("error", "unknown"))
+
+    @staticmethod
+    def _failure(reason: str):
+        return bench_core._finish(
+            bench_core._new_metrics(), f"❌ Exception: {reason}", None)
+
+    def close(self):
+        for proc in self._procs:
+            proc.stdin.close()
+        for proc in self._procs:
+            proc.wait()
+
+
+if __name__ == "__main__":
+    serve()
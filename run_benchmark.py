@@ -10,12 +10,28 @@ Usage:
 """
 
 import argparse
+import concurrent.futures
 import glob
 import os
-import subprocess
 import sys
 import time
 
+from bench_core import (
+    DEFAULT_TIMEOUT,
+    HAS_TQDM,
+    JAVA_XMX,
+    LEVEL_DIR,
+    SERVER_JAR,
+    VALID_STRATEGIES,
+    compile_client,
+    default_jobs,
+    discover_levels,
+    fmt,
+    prepare_cds,
+    progress,
+    run_level,
+)
+
 try:
     import openpyxl
     HAS_OPENPYXL = True
@@ -24,159 +40,8 @@ except ImportError:
 
 
 # ── Configuration ────────────────────────────────────────────────────────────
-LEVEL_DIR = "levels"
 OUTPUT_FILE = "benchmark_results.md"
-SERVER_JAR = "server.jar"
-DEFAULT_TIMEOUT = 180          # seconds per level
-JAVA_XMX = "4g"
 DEFAULT_STRATEGY = "bfs"
-VALID_STRATEGIES = ["bfs", "dfs", "astar", "wastar", "greedy"]
-
-
-# ── Helpers ──────────────────────────────────────────────────────────────────
-
-def compile_client():
-    """Compile the search client with javac."""
-    print("Compiling searchclient/*.java ...")
-    result = subprocess.run(
-        ["javac", "searchclient/*.java"],
-        shell=True,
-        capture_output=True,
-        text=True,
-    )
-    if result.returncode != 0:
-        print("ERROR: Compilation failed!")
-        print(result.stderr)
-        sys.exit(1)
-    print("Compilation successful.\n")
-
-
-def parse_output(output: str):
-    """
-    Parse combined stdout+stderr from the server / client for key metrics.
-
-    Looks for:
-        Found solution of length <N>.          (client stderr)
-        #Expanded: … #Frontier: … Time: …     (client stderr)
-        Memory used: …                         (client stderr)
-    """
-    solved = False
-    solution_length = "-"
-    solve_time = "-"
-    memory = "-"
-    expanded = "-"
-    frontier_size = "-"
-    generated = "-"
-
-    for line in output.splitlines():
-        if "Found solution of length" in line:
-            solved = True
-            try:
-                solution_length = line.split("length")[1].strip().strip(".,").replace(",", "")
-            except Exception:
-                pass
-
-        if "#Expanded:" in line:
-            try:
-                # Use regex to handle numbers with commas (e.g. 858,035)
-                import re
-                m_exp = re.search(r"#Expanded:\s*([\d,]+)", line)
-                m_frt = re.search(r"#Frontier:\s*([\d,]+)", line)
-                m_gen = re.search(r"#Generated:\s*([\d,]+)", line)
-                m_time = re.search(r"Time:\s*([\d.]+)\s*s", line)
-                if m_exp:
-                    expanded = m_exp.group(1).replace(",", "")
-                if m_frt:
-                    frontier_size = m_frt.group(1).replace(",", "")
-                if m_gen:
-                    generated = m_gen.group(1).replace(",", "")
-                if m_time:
-                    solve_time = m_time.group(1)
-            except Exception:
-                pass
-
-        if "Memory used:" in line:
-            try:
-                memory = line.split("Memory used:")[1].strip()
-            except Exception:
-                pass
-
-        if "Unable to solve level" in line:
-            solved = False
-
-    return {
-        "solved": solved,
-        "solution_length": solution_length,
-        "time": solve_time,
-        "memory": memory,
-        "expanded": expanded,
-        "generated": generated,
-    }
-
-
-def run_level(level_path: str, strategy: str, timeout: int):
-    """Run a single level through the server and return parsed metrics."""
-    client_cmd = f"java -Xmx{JAVA_XMX} searchclient.SearchClient -{strategy}"
-    cmd = [
-        "java", "-jar", SERVER_JAR,
-        "-l", level_path,
-        "-c", client_cmd,
-        "-t", str(timeout),
-    ]
-
-    level_name = os.path.basename(level_path)
-    print(f"  {level_name:<40s}", end="", flush=True)
-
-    wall_start = time.time()
-    try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=timeout + 10,      # extra grace period
-        )
-        wall_time = time.time() - wall_start
-        full_output = (result.stdout or "") + "\n" + (result.stderr or "")
-
-        metrics = parse_output(full_output)
-
-        if result.returncode != 0 and not metrics["solved"]:
-            metrics["status"] = "❌ Error"
-            print(f"  Error (exit {result.returncode})")
-        elif metrics["solved"]:
-            metrics["status"] = "✅ Solved"
-            print(f"  Solved  len={metrics['solution_length']:>6s}  t={metrics['time']:>8s}s")
-        else:
-            metrics["status"] = "❌ No solution"
-            print(f"  No solution  t={metrics['time']:>8s}s")
-
-        metrics["wall_time"] = f"{wall_time:.1f}"
-        return metrics
-
-    except subprocess.TimeoutExpired:
-        print(f"  ⏱️  Timeout (>{timeout}s)")
-        return {
-            "status": "⏱️ Timeout",
-            "solved": False,
-            "solution_length": "-",
-            "time": f">{timeout}",
-            "wall_time": f">{timeout}",
-            "memory": "-",
-            "expanded": "-",
-            "generated": "-",
-        }
-    except Exception as e:
-        print(f"  Exception: {e}")
-        return {
-            "status": "❌ Exception",
-            "solved": False,
-            "solution_length": "-",
-            "time": "-",
-            "wall_time": "-",
-            "memory": "-",
-            "expanded": "-",
-            "generated": "-",
-        }
 
 
 # ── Excel helpers ────────────────────────────────────────────────────────────
@@ -184,7 +49,9 @@ def run_level(level_path: str, strategy: str, timeout: int):
 def read_xlsx_tasks(xlsx_path: str):
     """Read (level, strategy) task pairs from the Excel file.
 
-    Returns a list of dicts: [{"level": "MAPF00", "strategy": "bfs", "sheet": ..., "row": ...}, ...]
+    Returns a list of dicts:
+    [{"level": "MAPF00", "lvl_path": ..., "strategy": "bfs", "sheet": ..., "row": ...}, ...]
+    where lvl_path is the resolved levels/ file or None if missing.
     """
     if not HAS_OPENPYXL:
         print("ERROR: openpyxl not installed. Install with: pip install openpyxl")
@@ -193,16 +60,24 @@ def read_xlsx_tasks(xlsx_path: str):
         print(f"ERROR: {xlsx_path} not found.")
         sys.exit(1)
 
-    wb = openpyxl.load_workbook(xlsx_path)
+    # read_only streams the sheet XML instead of building the full cell
+    # DOM, and data_only returns cached values for formula cells; both cut
+    # load time and memory by orders of magnitude on big sheets.
+    wb = openpyxl.load_workbook(xlsx_path, read_only=True, data_only=True)
     tasks = []
     for ws in wb.worksheets:
-        for row_idx in range(2, ws.max_row + 1):
-            cell_level = ws.cell(row=row_idx, column=1).value
-            cell_strategy = ws.cell(row=row_idx, column=2).value
+        for row_idx, row in enumerate(ws.iter_rows(min_row=2, max_col=2, values_only=True), start=2):
+            cell_level, cell_strategy = (row + (None, None))[:2]
             if cell_level and cell_strategy:
+                # Spreadsheets repeat the same level across strategies, but
+                # openpyxl allocates a fresh string per cell; interning
+                # collapses the duplicates and makes the level-index lookup
+                # (resolved here, once per task) an identity-fast dict hit.
+                level = sys.intern(cell_level.strip())
                 tasks.append({
-                    "level": cell_level.strip(),
-                    "strategy": cell_strategy.strip().lower(),
+                    "level": level,
+                    "lvl_path": find_level_file(level),
+                    "strategy": sys.intern(cell_strategy.strip().lower()),
                     "sheet": ws.title,
                     "row": row_idx,
                 })
@@ -210,49 +85,54 @@ def read_xlsx_tasks(xlsx_path: str):
     return tasks
 
 
-def write_xlsx_results(xlsx_path: str, task_results: list):
-    """Write benchmark results back to the Excel file.
+def write_xlsx_results(wb, task_results: list):
+    """Write benchmark results into an already-open workbook.
 
-    task_results: list of (task_dict, metrics_dict).
+    task_results: list of (task_dict, metrics). The caller owns the
+    workbook and saves it once — re-parsing the whole xlsx per write
+    would dominate on large sheets, so all writers share one open
+    workbook object.
     """
-    if not HAS_OPENPYXL:
-        return
-
-    wb = openpyxl.load_workbook(xlsx_path)
+    # The parser hands over real numbers (or None / a ">180" sentinel), so
+    # the cells get them verbatim — no string-to-number coercion here.
     updated = 0
-
     for task, metrics in task_results:
         if metrics is None:
             continue
         ws = wb[task["sheet"]]
         row = task["row"]
-        ws.cell(row=row, column=3).value = _to_number(metrics.get("generated", "-"))
-        ws.cell(row=row, column=4).value = _to_number(metrics.get("time", "-"))
-        ws.cell(row=row, column=5).value = _to_number(metrics.get("solution_length", "-"))
+        ws.cell(row=row, column=3).value = metrics.generated
+        ws.cell(row=row, column=4).value = metrics.time
+        ws.cell(row=row, column=5).value = metrics.solution_length
         updated += 1
-
-    wb.save(xlsx_path)
-    print(f"\nExcel: updated {updated} row(s) in {xlsx_path}")
+    return updated
 
 
-def _to_number(val):
-    """Convert string metric to int/float if possible, else return as-is."""
-    if val is None or val == "-":
-        return None
-    try:
-        if "." in str(val):
-            return float(val)
-        return int(val)
-    except (ValueError, TypeError):
-        return val
+# Lazily built name → path index of levels/. One directory read replaces a
+# stat() syscall per lookup, which matters when the spreadsheet repeats the
+# same level across strategies (and on networked filesystems).
+_level_index = None
 
 
 def find_level_file(level_name: str):
     """Find the .lvl file for a given level name. Returns path or None."""
-    path = os.path.join(LEVEL_DIR, f"{level_name}.lvl")
-    if os.path.exists(path):
-        return path
-    return None
+    global _level_index
+    if _level_index is None:
+        try:
+            _level_index = {
+                entry.name[:-4]: entry.path
+                for entry in os.scandir(LEVEL_DIR)
+                if entry.name.endswith(".lvl")
+            }
+        except FileNotFoundError:
+            _level_index = {}
+    return _level_index.get(level_name)
+
+
+def invalidate_level_index():
+    """Drop the cached index (call after writing new .lvl files)."""
+    global _level_index
+    _level_index = None
 
 
 # ── Main ─────────────────────────────────────────────────────────────────────
@@ -272,6 +152,11 @@ def main():
                         help="Output markdown file (default: benchmark_results.md)")
     parser.add_argument("--compile", action="store_true",
                         help="Compile searchclient before running")
+    parser.add_argument("-j", "--jobs", type=int, default=default_jobs(),
+                        help="Number of levels to run in parallel "
+                             f"(default: {default_jobs()}, bounded by CPUs and RAM/Xmx)")
+    parser.add_argument("--no-cds", action="store_true",
+                        help="Skip the AppCDS class-archive warmup (for debugging)")
     args = parser.parse_args()
 
     # ── Prerequisites ────────────────────────────────────────────────────
@@ -289,6 +174,9 @@ def main():
         print("  or run with --compile flag")
         sys.exit(1)
 
+    if not args.no_cds:
+        prepare_cds()
+
     # ── Excel-driven mode ────────────────────────────────────────────────
     if args.xlsx:
         run_xlsx_mode(args)
@@ -315,89 +203,91 @@ def run_xlsx_mode(args):
     print(f"  CWD      : {os.getcwd()}")
     print(f"{'=' * 60}\n")
 
-    # Run all tasks
-    task_results = []   # list of (task, metrics)
+    # Run all tasks. Each task is an independent JVM pipeline, so worker
+    # threads overlap freely; results land at their task's index so the
+    # Excel write-back and the report keep the spreadsheet order.
+    task_results = [None] * len(tasks)   # list of (task, metrics)
     solved_count = 0
-    skip_count = 0
     timeout_count = 0
     error_count = 0
 
-    for task in tasks:
-        level_name = task["level"]
-        strategy = task["strategy"]
-        lvl_path = find_level_file(level_name)
-
-        print(f"[{strategy.upper():>5s}] ", end="")
-
+    # Partition up front: tasks without a .lvl file never reach the
+    # executor, and the skip pass is one print instead of one per row.
+    jobs = []
+    skipped = []
+    for idx, task in enumerate(tasks):
+        lvl_path = task["lvl_path"]
         if lvl_path is None:
-            print(f"  {level_name:<40s}  ⚠️  Level file not found, skipped")
-            task_results.append((task, None))
-            skip_count += 1
-            continue
-
-        metrics = run_level(lvl_path, strategy, args.timeout)
-        task_results.append((task, metrics))
+            task_results[idx] = (task, None)
+            skipped.append(task["level"])
+        else:
+            jobs.append((idx, task, lvl_path))
+    skip_count = len(skipped)
+    if skipped:
+        print(f"⚠️  {skip_count} task(s) skipped, no .lvl file: {', '.join(sorted(set(skipped)))}\n")
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as ex:
+        futures = {
+            ex.submit(run_level, lvl_path, task["strategy"], args.timeout,
+                      verbose=not HAS_TQDM): idx
+            for idx, task, lvl_path in jobs
+        }
+        for fut in progress(concurrent.futures.as_completed(futures), len(futures)):
+            idx = futures[fut]
+            task_results[idx] = (tasks[idx], fut.result())
 
-        if metrics["solved"]:
+    for _task, metrics in task_results:
+        if metrics is None:
+            continue
+        if metrics.solved:
             solved_count += 1
-        elif "Timeout" in metrics["status"]:
+        elif "Timeout" in metrics.status:
             timeout_count += 1
         else:
             error_count += 1
 
-    # ── Write results back to Excel ──────────────────────────────────────
-    write_xlsx_results(args.xlsx, task_results)
+    # ── Write results back to Excel (one load, one save) ─────────────────
+    if HAS_OPENPYXL:
+        wb = openpyxl.load_workbook(args.xlsx)
+        updated = write_xlsx_results(wb, task_results)
+        wb.save(args.xlsx)
+        wb.close()
+        print(f"\nExcel: updated {updated} row(s) in {args.xlsx}")
 
     # ── Generate markdown report ─────────────────────────────────────────
+    # Written straight through a buffered handle: no intermediate lines
+    # list, no final join.
     effective_tasks = [tr for tr in task_results if tr[1] is not None]
-    lines = []
-    lines.append(f"# Benchmark Results\n")
-    lines.append(f"**Date:** {time.strftime('%Y-%m-%d %H:%M:%S')}  ")
-    lines.append(f"**Source:** `{args.xlsx}` | **Timeout:** {args.timeout}s | **Java Xmx:** {JAVA_XMX}  ")
-    lines.append(f"**Score:** {solved_count}/{len(effective_tasks)} solved")
-    if skip_count:
-        lines.append(f" | {skip_count} skipped (no .lvl)")
-    if timeout_count:
-        lines.append(f" | {timeout_count} timeout")
-    if error_count:
-        lines.append(f" | {error_count} error/unsolved")
-    lines.append("\n")
-    lines.append("| Level | Strategy | Status | Solution Length | Time (s) | Expanded | Generated | Memory |")
-    lines.append("|-------|----------|--------|-----------------|----------|----------|-----------|--------|")
-
-    for task, m in task_results:
-        if m is None:
-            lines.append(
-                f"| `{task['level']}` "
-                f"| {task['strategy'].upper()} "
-                f"| ⚠️ Skipped "
-                f"| - | - | - | - | - |"
-            )
-        else:
-            lines.append(
-                f"| `{task['level']}` "
-                f"| {task['strategy'].upper()} "
-                f"| {m['status']} "
-                f"| {m['solution_length']} "
-                f"| {m['time']} "
-                f"| {m['expanded']} "
-                f"| {m['generated']} "
-                f"| {m['memory']} |"
-            )
-
-    lines.append("")
-    lines.append("### Summary")
-    lines.append(f"- **Total tasks**: {len(tasks)}")
-    lines.append(f"- **Solved**: {solved_count} ✅")
-    lines.append(f"- **Skipped** (missing .lvl): {skip_count} ⚠️")
-    lines.append(f"- **Timeout**: {timeout_count} ⏱️")
-    lines.append(f"- **Error / Unsolved**: {error_count} ❌")
-
-    report = "\n".join(lines) + "\n"
 
     try:
-        with open(args.output, "w", encoding="utf-8") as f:
-            f.write(report)
+        with open(args.output, "w", encoding="utf-8", buffering=1 << 16) as f:
+            f.write("# Benchmark Results\n\n")
+            f.write(f"**Date:** {time.strftime('%Y-%m-%d %H:%M:%S')}  \n")
+            f.write(f"**Source:** `{args.xlsx}` | **Timeout:** {args.timeout}s | **Java Xmx:** {JAVA_XMX}  \n")
+            f.write(f"**Score:** {solved_count}/{len(effective_tasks)} solved\n")
+            if skip_count:
+                f.write(f" | {skip_count} skipped (no .lvl)\n")
+            if timeout_count:
+                f.write(f" | {timeout_count} timeout\n")
+            if error_count:
+                f.write(f" | {error_count} error/unsolved\n")
+            f.write("\n\n")
+            f.write("| Level | Strategy | Status | Solution Length | Time (s) | Expanded | Generated | Memory |\n")
+            f.write("|-------|----------|--------|-----------------|----------|----------|-----------|--------|\n")
+            for task, m in task_results:
+                if m is None:
+                    f.write(f"| `{task['level']}` | {task['strategy'].upper()} "
+                            f"| ⚠️ Skipped | - | - | - | - | - |\n")
+                else:
+                    f.write(f"| `{task['level']}` | {task['strategy'].upper()} "
+                            f"| {m.status} | {fmt(m.solution_length)} | {fmt(m.time)} "
+                            f"| {fmt(m.expanded)} | {fmt(m.generated)} | {fmt(m.memory)} |\n")
+            f.write("\n### Summary\n")
+            f.write(f"- **Total tasks**: {len(tasks)}\n")
+            f.write(f"- **Solved**: {solved_count} ✅\n")
+            f.write(f"- **Skipped** (missing .lvl): {skip_count} ⚠️\n")
+            f.write(f"- **Timeout**: {timeout_count} ⏱️\n")
+            f.write(f"- **Error / Unsolved**: {error_count} ❌\n")
         print(f"\n{'=' * 60}")
         print(f"  Results saved to {args.output}")
         print(f"  Score: {solved_count}/{len(effective_tasks)} solved"
@@ -420,11 +310,7 @@ def run_legacy_mode(args):
     print(f"{'=' * 60}\n")
 
     # Discover levels
-    pattern = os.path.join(LEVEL_DIR, "*.lvl")
-    levels = sorted(glob.glob(pattern))
-
-    if args.filter:
-        levels = [l for l in levels if os.path.basename(l).startswith(args.filter)]
+    levels = discover_levels(args.filter)
 
     if not levels:
         print(f"No levels found matching pattern in {LEVEL_DIR}/")
@@ -432,60 +318,54 @@ def run_legacy_mode(args):
 
     print(f"Found {len(levels)} level(s).\n")
 
-    # Run benchmark
-    results = []
+    # Run benchmark (levels in parallel; report keeps sorted order)
     solved_count = 0
     timeout_count = 0
     error_count = 0
 
-    for lvl in levels:
-        level_name = os.path.basename(lvl).replace(".lvl", "")
-        metrics = run_level(lvl, args.strategy, args.timeout)
+    metrics_by_level = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as ex:
+        futures = {
+            ex.submit(run_level, lvl_path, args.strategy, args.timeout,
+                      verbose=not HAS_TQDM): stem
+            for lvl_path, stem in levels
+        }
+        for fut in progress(concurrent.futures.as_completed(futures), len(futures)):
+            metrics_by_level[futures[fut]] = fut.result()
+
+    results = []
+    for _path, level_name in levels:
+        metrics = metrics_by_level[level_name]
         results.append((level_name, metrics))
-        if metrics["solved"]:
+        if metrics.solved:
             solved_count += 1
-        elif "Timeout" in metrics["status"]:
+        elif "Timeout" in metrics.status:
             timeout_count += 1
         else:
             error_count += 1
 
-    # Generate markdown report
-    lines = []
-    lines.append(f"# Benchmark Results\n")
-    lines.append(f"**Date:** {time.strftime('%Y-%m-%d %H:%M:%S')}  ")
-    lines.append(f"**Strategy:** `{args.strategy}` | **Timeout:** {args.timeout}s | **Java Xmx:** {JAVA_XMX}  ")
-    lines.append(f"**Score:** {solved_count}/{len(levels)} solved")
-    if timeout_count:
-        lines.append(f" | {timeout_count} timeout")
-    if error_count:
-        lines.append(f" | {error_count} error/unsolved")
-    lines.append("\n")
-    lines.append("| Level | Status | Solution Length | Time (s) | Expanded | Generated | Memory |")
-    lines.append("|-------|--------|-----------------|----------|----------|-----------|--------|")
-
-    for level_name, m in results:
-        lines.append(
-            f"| `{level_name}` "
-            f"| {m['status']} "
-            f"| {m['solution_length']} "
-            f"| {m['time']} "
-            f"| {m['expanded']} "
-            f"| {m['generated']} "
-            f"| {m['memory']} |"
-        )
-
-    lines.append("")
-    lines.append("### Summary")
-    lines.append(f"- **Total**: {len(levels)}")
-    lines.append(f"- **Solved**: {solved_count} ✅")
-    lines.append(f"- **Timeout**: {timeout_count} ⏱️")
-    lines.append(f"- **Error / Unsolved**: {error_count} ❌")
-
-    report = "\n".join(lines) + "\n"
-
+    # Generate markdown report (direct buffered writes, as in xlsx mode)
     try:
-        with open(args.output, "w", encoding="utf-8") as f:
-            f.write(report)
+        with open(args.output, "w", encoding="utf-8", buffering=1 << 16) as f:
+            f.write("# Benchmark Results\n\n")
+            f.write(f"**Date:** {time.strftime('%Y-%m-%d %H:%M:%S')}  \n")
+            f.write(f"**Strategy:** `{args.strategy}` | **Timeout:** {args.timeout}s | **Java Xmx:** {JAVA_XMX}  \n")
+            f.write(f"**Score:** {solved_count}/{len(levels)} solved\n")
+            if timeout_count:
+                f.write(f" | {timeout_count} timeout\n")
+            if error_count:
+                f.write(f" | {error_count} error/unsolved\n")
+            f.write("\n\n")
+            f.write("| Level | Status | Solution Length | Time (s) | Expanded | Generated | Memory |\n")
+            f.write("|-------|--------|-----------------|----------|----------|-----------|--------|\n")
+            for level_name, m in results:
+                f.write(f"| `{level_name}` | {m.status} | {fmt(m.solution_length)} "
+                        f"| {fmt(m.time)} | {fmt(m.expanded)} | {fmt(m.generated)} | {fmt(m.memory)} |\n")
+            f.write("\n### Summary\n")
+            f.write(f"- **Total**: {len(levels)}\n")
+            f.write(f"- **Solved**: {solved_count} ✅\n")
+            f.write(f"- **Timeout**: {timeout_count} ⏱️\n")
+            f.write(f"- **Error / Unsolved**: {error_count} ❌\n")
         print(f"\n{'=' * 60}")
         print(f"  Results saved to {args.output}")
         print(f"  Score: {solved_count}/{len(levels)} solved")